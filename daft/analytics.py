@@ -2,89 +2,186 @@ from __future__ import annotations
 
 import atexit
 import base64
-import dataclasses
+import collections
 import datetime
 import functools
+import gzip
+import http.client
 import json
 import logging
 import os
 import platform
 import random
+import threading
 import time
-import urllib.error
+import urllib.parse
 import urllib.request
 from typing import Any, Callable
 
+from daft.daft import build_type as _build_type
+from daft.dependencies import orjson
+
 _ANALYTICS_CLIENT = None
+_DAFT_ANALYTICS_ENABLED_ENV = os.getenv("DAFT_ANALYTICS_ENABLED")
+_USER_OPTED_OUT = _DAFT_ANALYTICS_ENABLED_ENV == "0"
 _WRITE_KEY = "ZU2LLq6HFW0kMEY6TiGZoGnRzogXBUwa"
-_SEGMENT_BATCH_ENDPOINT = "https://api.segment.io/v1/batch"
+_SEGMENT_HOST = "api.segment.io"
+_SEGMENT_BATCH_PATH = "/v1/batch"
+_SEGMENT_HEADERS = {
+    "Content-Type": "application/json",
+    "Content-Encoding": "gzip",
+    "User-Agent": "daft-analytics",
+    "Authorization": f"Basic {base64.b64encode(f'{_WRITE_KEY}:'.encode()).decode('utf-8')}",
+}
+_HTTP_TIMEOUT_SECONDS = 1
+_SHUTDOWN_TIMEOUT_SECONDS = 2.0
+# Maximum time an event waits in the buffer before it is flushed, even if the buffer is not yet full
+_FLUSH_INTERVAL_SECONDS = 5.0
 
 
 logger = logging.getLogger(__name__)
 
+_SESSION_KEY_CACHE: str | None = None
+
+# Keep-alive connection to Segment which is reused across flushes. Only ever used from the publisher thread.
+_HTTP_CONNECTION: http.client.HTTPSConnection | None = None
 
-@dataclasses.dataclass(frozen=True)
-class AnalyticsEvent:
-    session_id: str
-    event_name: str
-    event_time: datetime.datetime
-    data: dict[str, Any]
+
+@functools.cache
+def _get_platform_info() -> tuple[str, str]:
+    """Returns the (platform, python_version) of this process, which are constant but slow to compute."""
+    return platform.platform(), platform.python_version()
 
 
 def _get_session_key() -> str:
-    # Restrict the cardinality of keys to 800
-    return f"anon-{random.randint(1, 800)}"
+    global _SESSION_KEY_CACHE
+    if _SESSION_KEY_CACHE is None:
+        # Restrict the cardinality of keys to 800, rejecting out-of-range draws so that every key is equally likely
+        while (key := random.getrandbits(10)) >= 800:
+            pass
+        _SESSION_KEY_CACHE = f"anon-{key + 1}"
+    return _SESSION_KEY_CACHE
 
 
-def _build_segment_batch_payload(
-    events: list[AnalyticsEvent], daft_version: str, daft_build_type: str
-) -> dict[str, Any]:
-    return {
-        "batch": [
-            {
-                "type": "track",
-                "anonymousId": event.session_id,
-                "event": event.event_name,
-                "properties": event.data,
-                "timestamp": event.event_time.isoformat(),
-                "context": {
-                    "app": {
-                        "name": "daft",
-                        "version": daft_version,
-                        "build": daft_build_type,
-                    },
-                },
-            }
-            for event in events
-        ],
-    }
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, datetime.datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+@functools.cache
+def _orjson_available() -> bool:
+    # LazyImport retries a failed import on every check, so only probe for orjson once
+    return orjson.module_available()
+
+
+def _serialize_payload(payload: dict[str, Any]) -> bytes:
+    """Serializes a payload to UTF-8 JSON bytes, using orjson if it is installed."""
+    if _orjson_available():
+        return orjson.dumps(payload)
+    return json.dumps(payload, default=_json_default).encode("utf-8")
+
+
+@functools.cache
+def _get_segment_proxy() -> tuple[str, int | None, dict[str, str]] | None:
+    """Returns the (host, port, tunnel headers) of the HTTPS proxy to reach Segment through, if any.
+
+    This honours the same environment and system proxy settings as `urllib.request`.
+    """
+    if urllib.request.proxy_bypass(_SEGMENT_HOST):
+        return None
+    proxy_url = urllib.request.getproxies().get("https")
+    if not proxy_url:
+        return None
+    if "://" not in proxy_url:
+        proxy_url = f"http://{proxy_url}"
+    proxy = urllib.parse.urlsplit(proxy_url)
+    if proxy.hostname is None:
+        return None
+
+    tunnel_headers = {}
+    if proxy.username is not None:
+        credentials = f"{urllib.parse.unquote(proxy.username)}:{urllib.parse.unquote(proxy.password or '')}"
+        tunnel_headers["Proxy-Authorization"] = f"Basic {base64.b64encode(credentials.encode()).decode('utf-8')}"
+    return proxy.hostname, proxy.port, tunnel_headers
+
+
+def _get_http_connection() -> http.client.HTTPSConnection:
+    global _HTTP_CONNECTION
+    if _HTTP_CONNECTION is None:
+        proxy = _get_segment_proxy()
+        if proxy is None:
+            _HTTP_CONNECTION = http.client.HTTPSConnection(_SEGMENT_HOST, timeout=_HTTP_TIMEOUT_SECONDS)
+        else:
+            # Tunnel through the proxy with CONNECT, as urllib does for HTTPS requests
+            proxy_host, proxy_port, tunnel_headers = proxy
+            _HTTP_CONNECTION = http.client.HTTPSConnection(proxy_host, proxy_port, timeout=_HTTP_TIMEOUT_SECONDS)
+            _HTTP_CONNECTION.set_tunnel(_SEGMENT_HOST, headers=tunnel_headers)
+    return _HTTP_CONNECTION
+
+
+def _close_http_connection() -> None:
+    global _HTTP_CONNECTION
+    if _HTTP_CONNECTION is not None:
+        _HTTP_CONNECTION.close()
+        _HTTP_CONNECTION = None
+
+
+def _send_segment_request(body: bytes, headers: dict[str, str]) -> http.client.HTTPResponse:
+    conn = _get_http_connection()
+    try:
+        conn.request("POST", _SEGMENT_BATCH_PATH, body=body, headers=headers)
+        resp = conn.getresponse()
+    except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+        # Segment may have closed the idle keep-alive connection, so retry once on a fresh connection
+        _close_http_connection()
+        conn = _get_http_connection()
+        conn.request("POST", _SEGMENT_BATCH_PATH, body=body, headers=headers)
+        resp = conn.getresponse()
+    # The response must be fully read before the connection can be reused
+    resp.read()
+    return resp
 
 
 def _post_segment_track_endpoint(analytics_client: AnalyticsClient, payload: dict[str, Any]) -> None:
     """Posts a batch of JSON data to Segment."""
-    req = urllib.request.Request(
-        _SEGMENT_BATCH_ENDPOINT,
-        method="POST",
-        headers={
-            "Content-Type": "application/json",
-            "User-Agent": "daft-analytics",
-            "Authorization": f"Basic {base64.b64encode(f'{_WRITE_KEY}:'.encode()).decode('utf-8')}",
-        },
-        data=json.dumps(payload).encode("utf-8"),
-    )
+    # Batches are highly repetitive JSON, so even the fastest compression level shrinks them considerably
+    body = gzip.compress(_serialize_payload(payload), compresslevel=1)
     try:
-        resp = urllib.request.urlopen(
-            req,
-            timeout=1,
-        )
-    except urllib.error.URLError:
-        analytics_client._is_active = False
-    if resp.status != 200:
+        resp = _send_segment_request(body, _SEGMENT_HEADERS)
+    except (OSError, http.client.HTTPException):
+        _close_http_connection()
+        analytics_client._deactivate()
+        return
+    if resp.status >= 400:
+        # Stop publishing rather than paying for a failing request on every subsequent flush
+        logger.debug("HTTP request to segment returned status code %s; disabling analytics", resp.status)
+        analytics_client._deactivate()
+    elif resp.status != 200:
         raise RuntimeError(f"HTTP request to segment returned status code: {resp.status}")
 
 
+def _analytics_enabled(daft_build_type: str, user_opted_out: bool) -> bool:
+    """Analytics is never enabled for dev builds or when the user has opted out."""
+    return (not user_opted_out) and daft_build_type != "dev"
+
+
+# When analytics can never be enabled in this process, the timing decorators return the undecorated function. They are
+# applied once per function by the public API decorators in `daft.api_annotations`, so this is checked at decoration
+# time rather than on every call.
+_ANALYTICS_PERMANENTLY_OFF = not _analytics_enabled(_build_type(), _USER_OPTED_OUT)
+
+
+def _noop_append_to_log(event_name: str, data: dict[str, Any]) -> None:
+    pass
+
+
 class AnalyticsClient:
-    """Non-threadsafe client for sending analytics events, which is a singleton for each Python process."""
+    """Client for sending analytics events, which is a singleton for each Python process.
+
+    Events are buffered by the calling thread and published to Segment by a background daemon thread, so that network
+    I/O never happens on the caller's critical path.
+    """
 
     def __init__(
         self,
@@ -92,89 +189,187 @@ class AnalyticsClient:
         daft_build_type: str,
         enabled: bool,
         publish_payload_function: Callable[[AnalyticsClient, dict[str, Any]], None] = _post_segment_track_endpoint,
-        buffer_capacity: int = 100,
+        buffer_capacity: int = 256,
     ) -> None:
         self._is_active = enabled
-        self._daft_version = daft_version
-        self._daft_build_type = daft_build_type
         self._session_key = _get_session_key()
 
+        # Context attached to every event; shared by reference since it is never mutated
+        self._context = {
+            "app": {
+                "name": "daft",
+                "version": daft_version,
+                "build": daft_build_type,
+            },
+        }
+
         # Function to publish a payload to Segment
         self._publish = publish_payload_function
 
-        # Buffer for events to be sent to Segment
+        # Buffer of Segment event payloads, built as events arrive and only accessed from the publisher thread
         self._buffer_capacity = buffer_capacity
-        self._buffer: list[AnalyticsEvent] = []
+        self._buffer: list[dict[str, Any]] = []
 
-    def _append_to_log(self, event_name: str, data: dict[str, Any]) -> None:
+        # Ring buffer of (event_name, event_timestamp, data) tuples handed off from calling threads to the publisher
+        # thread. It is bounded so that if the publisher stalls, the newest events evict the oldest instead of growing
+        # memory without limit.
+        self._pending: collections.deque[tuple[str, float, dict[str, Any]]] = collections.deque(
+            maxlen=buffer_capacity * 4
+        )
+        self._wakeup = threading.Event()
+        # Whether the publisher thread has no buffered events, in which case calling threads wake it for the next event
+        # so that its flush deadline starts from that event's arrival
+        self._publisher_idle = True
+        self._shutting_down = False
+        self._worker_thread: threading.Thread | None = None
+        if enabled:
+            self._start_worker()
+        else:
+            logger.debug("Analytics is disabled; not sending data to segment")
+            self._append_to_log = _noop_append_to_log  # type: ignore[method-assign]
+
+    def _start_worker(self) -> None:
+        self._worker_thread = threading.Thread(target=self._worker, name="daft-analytics", daemon=True)
+        self._worker_thread.start()
+
+    def _reinit_after_fork(self) -> None:
+        """Restarts publishing in a forked child process, which does not inherit the parent's publisher thread."""
+        # Events inherited from the parent are still published by the parent, and its synchronization primitives may
+        # have been held by another thread at the time of the fork
+        self._buffer = []
+        self._pending.clear()
+        self._wakeup = threading.Event()
+        self._publisher_idle = True
+        self._shutting_down = False
+        self._worker_thread = None
         if self._is_active:
-            self._buffer.append(
-                AnalyticsEvent(
-                    session_id=self._session_key,
-                    event_name=event_name,
-                    event_time=datetime.datetime.now(datetime.timezone.utc),
-                    data=data,
+            self._start_worker()
+
+    def _append_to_log(self, event_name: str, data: dict[str, Any]) -> None:
+        self._pending.append((event_name, time.time(), data))
+        if self._publisher_idle or len(self._pending) >= self._buffer_capacity:
+            self._wakeup.set()
+
+    def _deactivate(self) -> None:
+        """Permanently stops the client from recording and publishing events."""
+        self._is_active = False
+        self._append_to_log = _noop_append_to_log  # type: ignore[method-assign]
+
+    def _worker(self) -> None:
+        """Publisher thread loop.
+
+        Buffered events are flushed once `buffer_capacity` events are buffered, or once the oldest buffered event has
+        waited for `_FLUSH_INTERVAL_SECONDS`.
+        """
+        flush_deadline: float | None = None
+        while True:
+            timeout = None if flush_deadline is None else max(flush_deadline - time.monotonic(), 0.0)
+            self._wakeup.wait(timeout=timeout)
+            self._wakeup.clear()
+
+            while self._pending and self._is_active:
+                event_name, event_timestamp, data = self._pending.popleft()
+                if not self._buffer:
+                    self._publisher_idle = False
+                    flush_deadline = time.monotonic() + _FLUSH_INTERVAL_SECONDS
+                self._buffer.append(
+                    {
+                        "type": "track",
+                        "anonymousId": self._session_key,
+                        "event": event_name,
+                        "properties": data,
+                        "timestamp": datetime.datetime.fromtimestamp(event_timestamp, tz=datetime.timezone.utc),
+                        "context": self._context,
+                    }
                 )
-            )
-            if len(self._buffer) >= self._buffer_capacity:
+                if len(self._buffer) >= self._buffer_capacity:
+                    self._flush()
+
+            if not self._is_active:
+                # Publishing was deactivated, so there is nothing left for this thread to do
+                self._buffer = []
+                self._pending.clear()
+                return
+
+            if self._shutting_down:
                 self._flush()
-        else:
-            logger.debug("Analytics is disabled; not sending data to segment")
+                return
+
+            if flush_deadline is not None and time.monotonic() >= flush_deadline:
+                self._flush()
+
+            if not self._buffer:
+                flush_deadline = None
+                self._publisher_idle = True
+                # Events appended before calling threads saw the idle flag would otherwise wait for the next wakeup
+                if self._pending:
+                    self._wakeup.set()
 
     def _flush(self) -> None:
+        if not self._buffer:
+            return
         try:
-            payload = _build_segment_batch_payload(self._buffer, self._daft_version, self._daft_build_type)
-            self._publish(self, payload)
+            if self._is_active:
+                self._publish(self, {"batch": self._buffer})
         except Exception as e:
             # No-op on failure to avoid crashing the program - TODO: add retries for more robust logging
             logger.debug("Error in analytics publisher thread: %s", e)
         finally:
             self._buffer = []
 
+    def _shutdown(self) -> None:
+        """Signals the publisher thread to flush any pending events, and waits a short while for it to finish."""
+        if self._worker_thread is None or not self._worker_thread.is_alive():
+            return
+        self._shutting_down = True
+        self._wakeup.set()
+        self._worker_thread.join(timeout=_SHUTDOWN_TIMEOUT_SECONDS)
+
     def track_import(self) -> None:
+        platform_name, python_version = _get_platform_info()
         self._append_to_log(
             "Imported Daft",
             {
-                "platform": platform.platform(),
-                "python_version": platform.python_version(),
-                "DAFT_ANALYTICS_ENABLED": os.getenv("DAFT_ANALYTICS_ENABLED"),
+                "platform": platform_name,
+                "python_version": python_version,
+                "DAFT_ANALYTICS_ENABLED": _DAFT_ANALYTICS_ENABLED_ENV,
             },
         )
 
     def track_df_method_call(self, method_name: str, duration_seconds: float, error: str | None = None) -> None:
-        optionals = {}
-        if error is not None:
-            optionals["error"] = error
-        self._append_to_log(
-            "DataFrame Method Call",
-            {
-                "method_name": method_name,
-                "duration_seconds": duration_seconds,
-                **optionals,
-            },
-        )
+        if error is None:
+            data = {"method_name": method_name, "duration_seconds": duration_seconds}
+        else:
+            data = {"method_name": method_name, "duration_seconds": duration_seconds, "error": error}
+        self._append_to_log("DataFrame Method Call", data)
 
     def track_fn_call(self, fn_name: str, duration_seconds: float, error: str | None = None) -> None:
-        optionals = {}
-        if error is not None:
-            optionals["error"] = error
-        self._append_to_log(
-            "daft API Call",
-            {
-                "fn_name": fn_name,
-                "duration_seconds": duration_seconds,
-                **optionals,
-            },
-        )
+        if error is None:
+            data = {"fn_name": fn_name, "duration_seconds": duration_seconds}
+        else:
+            data = {"fn_name": fn_name, "duration_seconds": duration_seconds, "error": error}
+        self._append_to_log("daft API Call", data)
 
 
-def init_analytics(daft_version: str, daft_build_type: str, user_opted_out: bool) -> AnalyticsClient:
+def _after_fork_in_child() -> None:
+    global _HTTP_CONNECTION
+    # The connection's socket is shared with the parent process, so the child must open its own
+    _HTTP_CONNECTION = None
+    if _ANALYTICS_CLIENT is not None:
+        _ANALYTICS_CLIENT._reinit_after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def init_analytics(daft_version: str, daft_build_type: str, user_opted_out: bool = _USER_OPTED_OUT) -> AnalyticsClient:
     """Initialize the analytics module.
 
     Returns:
         AnalyticsClient: initialized singleton AnalyticsClient
     """
-    enabled = (not user_opted_out) and daft_build_type != "dev"
+    enabled = _analytics_enabled(daft_build_type, user_opted_out)
 
     global _ANALYTICS_CLIENT
 
@@ -182,30 +377,35 @@ def init_analytics(daft_version: str, daft_build_type: str, user_opted_out: bool
         return _ANALYTICS_CLIENT
 
     _ANALYTICS_CLIENT = AnalyticsClient(daft_version, daft_build_type, enabled)
-    atexit.register(_ANALYTICS_CLIENT._flush)
+    atexit.register(_ANALYTICS_CLIENT._shutdown)
     return _ANALYTICS_CLIENT
 
 
 def time_df_method(method: Callable[..., Any]) -> Callable[..., Any]:
     """Decorator to track metrics about Dataframe method calls."""
+    if _ANALYTICS_PERMANENTLY_OFF:
+        return method
+
+    method_name = method.__name__
 
     @functools.wraps(method)
     def tracked_method(*args: Any, **kwargs: Any) -> Any:
-        if _ANALYTICS_CLIENT is None:
+        client = _ANALYTICS_CLIENT
+        if client is None:
             return method(*args, **kwargs)
 
-        start = time.time()
+        start = time.perf_counter()
         try:
             result = method(*args, **kwargs)
         except Exception as e:
-            _ANALYTICS_CLIENT.track_df_method_call(
-                method_name=method.__name__, duration_seconds=time.time() - start, error=str(type(e).__name__)
+            client.track_df_method_call(
+                method_name=method_name, duration_seconds=time.perf_counter() - start, error=type(e).__name__
             )
             raise
 
-        _ANALYTICS_CLIENT.track_df_method_call(
-            method_name=method.__name__,
-            duration_seconds=time.time() - start,
+        client.track_df_method_call(
+            method_name=method_name,
+            duration_seconds=time.perf_counter() - start,
         )
         return result
 
@@ -214,24 +414,27 @@ def time_df_method(method: Callable[..., Any]) -> Callable[..., Any]:
 
 def time_func(fn: Callable[..., Any]) -> Callable[..., Any]:
     """Decorator to track metrics for daft API calls."""
+    if _ANALYTICS_PERMANENTLY_OFF:
+        return fn
+
+    fn_name = fn.__name__
 
     @functools.wraps(fn)
     def tracked_fn(*args: Any, **kwargs: Any) -> Any:
         __tracebackhide__ = True
-        if _ANALYTICS_CLIENT is None:
+        client = _ANALYTICS_CLIENT
+        if client is None:
             return fn(*args, **kwargs)
-        start = time.time()
+        start = time.perf_counter()
         try:
             result = fn(*args, **kwargs)
         except Exception as e:
-            _ANALYTICS_CLIENT.track_fn_call(
-                fn_name=fn.__name__, duration_seconds=time.time() - start, error=str(type(e).__name__)
-            )
+            client.track_fn_call(fn_name=fn_name, duration_seconds=time.perf_counter() - start, error=type(e).__name__)
             raise
 
-        _ANALYTICS_CLIENT.track_fn_call(
-            fn_name=fn.__name__,
-            duration_seconds=time.time() - start,
+        client.track_fn_call(
+            fn_name=fn_name,
+            duration_seconds=time.perf_counter() - start,
         )
         return result
 
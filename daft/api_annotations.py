@@ -18,11 +18,11 @@ P = ParamSpec("P")
 
 def DataframePublicAPI(func: Callable[P, T]) -> Callable[P, T]:
     """A decorator to mark a function as part of the Daft DataFrame's public API."""
+    timed_method = time_df_method(func)
 
     @functools.wraps(func)
     def _wrap(*args: P.args, **kwargs: P.kwargs) -> T:
         type_check_function(func, *args, **kwargs)
-        timed_method = time_df_method(func)
         return timed_method(*args, **kwargs)
 
     return _wrap
@@ -30,12 +30,12 @@ def DataframePublicAPI(func: Callable[P, T]) -> Callable[P, T]:
 
 def PublicAPI(func: Callable[P, T]) -> Callable[P, T]:
     """A decorator to mark a function as part of the Daft public API."""
+    timed_func = time_func(func)
 
     @functools.wraps(func)
     def _wrap(*args: P.args, **kwargs: P.kwargs) -> T:
         __tracebackhide__ = True
         type_check_function(func, *args, **kwargs)
-        timed_func = time_func(func)
         return timed_func(*args, **kwargs)
 
     return _wrap
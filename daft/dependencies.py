@@ -27,12 +27,14 @@ else:
     pq = LazyImport("pyarrow.parquet")
     flight = LazyImport("pyarrow.flight")
 
+orjson = LazyImport("orjson")
 unity_catalog = LazyImport("daft.unity_catalog")
 
 __all__ = [
     "flight",
     "fsspec",
     "np",
+    "orjson",
     "pa",
     "pacsv",
     "pads",
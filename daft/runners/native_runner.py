@@ -15,7 +15,7 @@ from daft.runners.partitioning import (
     PartitionCacheEntry,
     PartitionSetCache,
 )
-from daft.runners.runner import LOCAL_PARTITION_SET_CACHE, Runner
+from daft.runners.runner import Runner, get_local_partition_set_cache
 from daft.scarf_telemetry import track_runner_on_scarf
 
 if TYPE_CHECKING:
@@ -53,7 +53,7 @@ class NativeRunner(Runner[MicroPartition]):
             set_compute_runtime_num_worker_threads(num_threads)
 
     def initialize_partition_set_cache(self) -> PartitionSetCache:
-        return LOCAL_PARTITION_SET_CACHE
+        return get_local_partition_set_cache()
 
     def runner_io(self) -> NativeRunnerIO:
         return NativeRunnerIO()
@@ -30,7 +30,7 @@ from daft.runners.partitioning import (
 )
 from daft.runners.profiler import profiler
 from daft.runners.progress_bar import ProgressBar
-from daft.runners.runner import LOCAL_PARTITION_SET_CACHE, Runner
+from daft.runners.runner import Runner, get_local_partition_set_cache
 from daft.scarf_telemetry import track_runner_on_scarf
 
 if TYPE_CHECKING:
@@ -320,7 +320,7 @@ class PyRunner(Runner[MicroPartition], ActorPoolManager):
         )
 
     def initialize_partition_set_cache(self) -> PartitionSetCache:
-        return LOCAL_PARTITION_SET_CACHE
+        return get_local_partition_set_cache()
 
     def runner_io(self) -> PyRunnerIO:
         return PyRunnerIO()
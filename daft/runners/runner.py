@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import functools
 from abc import abstractmethod
 from typing import TYPE_CHECKING, Any, ClassVar, Generic, Iterator, Literal
 
@@ -16,7 +17,18 @@ if TYPE_CHECKING:
     from daft.recordbatch import MicroPartition
     from daft.runners.runner_io import RunnerIO
 
-LOCAL_PARTITION_SET_CACHE = PartitionSetCache()
+
+@functools.cache
+def get_local_partition_set_cache() -> PartitionSetCache:
+    """Returns the process-wide partition set cache shared by the local runners, creating it on first use."""
+    return PartitionSetCache()
+
+
+def __getattr__(name: str) -> Any:
+    # Preserve the `LOCAL_PARTITION_SET_CACHE` module attribute, which is now created lazily
+    if name == "LOCAL_PARTITION_SET_CACHE":
+        return get_local_partition_set_cache()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class Runner(Generic[PartitionT]):
@@ -25,6 +37,13 @@ class Runner(Generic[PartitionT]):
     def __init__(self) -> None:
         self._part_set_cache = self.initialize_partition_set_cache()
 
+        # Bind the cache accessors directly to the cache's methods to skip the forwarding call, unless a subclass
+        # overrides them with its own behavior
+        if type(self).get_partition_set_from_cache is Runner.get_partition_set_from_cache:
+            self.get_partition_set_from_cache = self._part_set_cache.get_partition_set  # type: ignore[method-assign]
+        if type(self).put_partition_set_into_cache is Runner.put_partition_set_into_cache:
+            self.put_partition_set_into_cache = self._part_set_cache.put_partition_set  # type: ignore[method-assign]
+
     def get_partition_set_from_cache(self, pset_id: str) -> PartitionCacheEntry:
         return self._part_set_cache.get_partition_set(pset_id=pset_id)
 
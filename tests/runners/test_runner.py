@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from typing import Any
+
+import pytest
+
+import daft.runners.runner as runner_module
+from daft.runners.partitioning import LocalPartitionSet, PartitionCacheEntry, PartitionSet, PartitionSetCache
+from daft.runners.runner import Runner, get_local_partition_set_cache
+
+
+class _CacheRunner(Runner[Any]):
+    def initialize_partition_set_cache(self) -> PartitionSetCache:
+        return PartitionSetCache()
+
+
+class _OverridingCacheRunner(_CacheRunner):
+    """Mirrors RayRunner, which overrides `put_partition_set_into_cache` to convert partition sets before caching."""
+
+    def __init__(self) -> None:
+        self.overridden_calls: list[PartitionSet[Any]] = []
+        super().__init__()
+
+    def put_partition_set_into_cache(self, pset: PartitionSet[Any]) -> PartitionCacheEntry:
+        self.overridden_calls.append(pset)
+        return self._part_set_cache.put_partition_set(pset=pset)
+
+
+def test_runner_binds_cache_accessors_to_cache():
+    runner = _CacheRunner()
+
+    assert runner.get_partition_set_from_cache == runner._part_set_cache.get_partition_set
+    assert runner.put_partition_set_into_cache == runner._part_set_cache.put_partition_set
+
+    pset = LocalPartitionSet()
+    entry = runner.put_partition_set_into_cache(pset=pset)
+    assert runner.get_partition_set_from_cache(pset_id=entry.key) is entry
+
+
+def test_runner_keeps_subclass_cache_accessor_overrides():
+    runner = _OverridingCacheRunner()
+
+    assert runner.put_partition_set_into_cache != runner._part_set_cache.put_partition_set
+    assert runner.get_partition_set_from_cache == runner._part_set_cache.get_partition_set
+
+    pset = LocalPartitionSet()
+    entry = runner.put_partition_set_into_cache(pset)
+    assert runner.overridden_calls == [pset]
+    assert runner.get_partition_set_from_cache(entry.key) is entry
+
+
+def test_local_partition_set_cache_module_attribute():
+    from daft.runners.runner import LOCAL_PARTITION_SET_CACHE
+
+    assert LOCAL_PARTITION_SET_CACHE is get_local_partition_set_cache()
+    assert runner_module.LOCAL_PARTITION_SET_CACHE is get_local_partition_set_cache()
+
+
+def test_runner_module_unknown_attribute_raises():
+    with pytest.raises(AttributeError, match="NOT_A_REAL_ATTRIBUTE"):
+        runner_module.NOT_A_REAL_ATTRIBUTE